@@ -4,10 +4,149 @@ Fix duplicate TOML sections by merging them automatically.
 Specifically handles common duplicates like [tool.pytest.ini_options].
 """
 
+import itertools
+import shutil
 import sys
-import re
 from pathlib import Path
 
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        print("Installing tomli for TOML parsing...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli"])
+        import tomli as tomllib
+
+# TOML writer, imported on first use (see _get_writer)
+_tomli_w = None
+
+
+PYTEST_HEADER = '[tool.pytest.ini_options]'
+
+def _is_table_header(text):
+    """Return True if a stripped line is a [table] or [[array-of-tables]] header."""
+    text = text.split('#', 1)[0].rstrip()
+    return text.startswith('[') and text.endswith(']') and '=' not in text
+
+
+def _track_open_values(line, depth, string_delim):
+    """
+    Update the lexical state after a value line: how many [ / { brackets are still
+    open and which multi-line string delimiter (triple double or single quotes) is
+    still open, if any. Returns (depth, string_delim).
+    """
+    i = 0
+    while i < len(line):
+        if string_delim:
+            if line.startswith(string_delim, i):
+                i += len(string_delim)
+                string_delim = None
+            elif line[i] == '\\' and string_delim[0] == '"':
+                i += 2
+            else:
+                i += 1
+            continue
+        char = line[i]
+        if char == '#':
+            break
+        if line.startswith('"""', i) or line.startswith("'''", i):
+            string_delim = line[i:i + 3]
+            i += 3
+            continue
+        if char in '"\'':
+            string_delim = char
+        elif char in '[{':
+            depth += 1
+        elif char in ']}':
+            depth = max(depth - 1, 0)
+        i += 1
+    if string_delim in ('"', "'"):
+        # Single-line strings cannot continue on the next line
+        string_delim = None
+    return depth, string_delim
+
+
+def _find_pytest_sections(content):
+    """
+    Locate every [tool.pytest.ini_options] section in the file with a single line scan.
+    Returns a list of (start, end) character spans; a span covers the header,
+    the section body and any blank lines directly after it, but not comments
+    that introduce the next table. Lines inside multi-line arrays, inline tables
+    and multi-line strings are never taken for headers or comments.
+    """
+    spans = []
+    start = end = None
+    offset = 0
+    depth, string_delim = 0, None
+    for line in content.splitlines(keepends=True):
+        text = line.strip()
+        in_value = depth > 0 or string_delim is not None
+        if not in_value and _is_table_header(text):
+            if start is not None:
+                spans.append((start, end))
+                start = None
+            if text.split('#', 1)[0].rstrip() == PYTEST_HEADER:
+                start, end = offset, offset + len(line)
+        else:
+            if start is not None and (in_value or (text and not text.startswith('#')) or (not text and end == offset)):
+                # Content line, or a blank line directly after one; trailing comments are left out
+                end = offset + len(line)
+            depth, string_delim = _track_open_values(line, depth, string_delim)
+        offset += len(line)
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+def _get_writer():
+    """
+    Import tomli_w on first use, installing it if missing.
+    """
+    global _tomli_w
+    if _tomli_w is None:
+        try:
+            import tomli_w
+        except ImportError:
+            print("Installing tomli_w for TOML writing...")
+            import subprocess
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli_w"])
+            import tomli_w
+        _tomli_w = tomli_w
+    return _tomli_w
+
+
+def _merge_ini_options(merged, duplicate):
+    """
+    Merge a duplicate ini_options table into the first one.
+    Arrays are combined (duplicates removed, order preserved), scalars keep the first value.
+    """
+    for key, value in duplicate.items():
+        if key not in merged:
+            merged[key] = value
+            continue
+        print(f"    Merging duplicate key: {key}")
+        if isinstance(merged[key], list) and isinstance(value, list):
+            # Remove duplicates, preserve order
+            seen = set()
+            combined = []
+            for item in itertools.chain(merged[key], value):
+                try:
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                except TypeError:
+                    # Nested arrays and inline tables are unhashable; compare by value instead
+                    if item in combined:
+                        continue
+                combined.append(item)
+            merged[key] = combined
+        else:
+            # For non-arrays, keep the first one (or could ask user)
+            print(f"      Keeping first value: {merged[key]!r}")
+
 
 def fix_duplicate_sections(file_path, backup=True):
     """
@@ -15,86 +154,47 @@ def fix_duplicate_sections(file_path, backup=True):
     """
     if backup:
         backup_path = f"{file_path}.backup"
-        with open(file_path, 'r') as src, open(backup_path, 'w') as dst:
-            dst.write(src.read())
+        shutil.copyfile(file_path, backup_path)
         print(f"✓ Created backup: {backup_path}")
     
-    with open(file_path, 'r') as f:
-        content = f.read()
+    content = Path(file_path).read_text()
     
-    # Find all instances of [tool.pytest.ini_options]
-    pytest_sections = []
-    pytest_pattern = r'\[tool\.pytest\.ini_options\](.*?)(?=\[|\Z)'
-    
-    matches = list(re.finditer(pytest_pattern, content, re.DOTALL))
-    
-    if len(matches) <= 1:
+    # Every header contains the literal, so at most one occurrence means no duplicates
+    if content.count(PYTEST_HEADER) <= 1:
         print("✓ No duplicate [tool.pytest.ini_options] sections found")
         return False
     
-    print(f"Found {len(matches)} [tool.pytest.ini_options] sections")
-    
-    # Extract and merge all pytest.ini_options content
-    all_settings = {}
-    all_content_lines = []
+    # Find all instances of [tool.pytest.ini_options]
+    spans = _find_pytest_sections(content)
     
-    for i, match in enumerate(matches):
-        section_content = match.group(1).strip()
-        print(f"  Section {i+1} at position {match.start()}")
-        
-        # Parse the section content
-        for line in section_content.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            if '=' in line:
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # Handle array values
-                if key in all_settings:
-                    print(f"    Merging duplicate key: {key}")
-                    # For arrays, merge them
-                    if value.startswith('[') and all_settings[key].startswith('['):
-                        # Extract array items
-                        old_items = re.findall(r'"([^"]*)"', all_settings[key])
-                        new_items = re.findall(r'"([^"]*)"', value)
-                        combined = list(dict.fromkeys(old_items + new_items))  # Remove duplicates, preserve order
-                        all_settings[key] = '[\n    ' + ',\n    '.join(f'"{item}"' for item in combined) + ',\n]'
-                    else:
-                        # For non-arrays, keep the first one (or could ask user)
-                        print(f"      Keeping first value: {all_settings[key]}")
-                else:
-                    all_settings[key] = value
+    if len(spans) <= 1:
+        print("✓ No duplicate [tool.pytest.ini_options] sections found")
+        return False
     
-    # Generate the merged section
-    merged_content = "[tool.pytest.ini_options]\n"
-    for key, value in all_settings.items():
-        if value.startswith('['):
-            merged_content += f"{key} = {value}\n"
-        else:
-            merged_content += f"{key} = {value}\n"
+    print(f"Found {len(spans)} [tool.pytest.ini_options] sections")
     
-    # Remove all existing pytest sections and insert the merged one
-    # Find the position of the first section
-    first_match = matches[0]
+    # Parse each section on its own and fold it into the first one
+    merged = {}
+    for i, (start, end) in enumerate(spans):
+        print(f"  Section {i+1} at position {start}")
+        _merge_ini_options(merged, tomllib.loads(content[start:end])['tool']['pytest']['ini_options'])
     
-    # Remove all pytest sections
-    new_content = content
-    for match in reversed(matches):  # Remove from end to preserve positions
-        new_content = new_content[:match.start()] + new_content[match.end():]
+    merged_content = _get_writer().dumps({'tool': {'pytest': {'ini_options': merged}}})
     
-    # Insert merged section at the position of the first one
-    insertion_point = first_match.start()
-    new_content = new_content[:insertion_point] + merged_content + "\n" + new_content[insertion_point:]
+    # Rebuild the file in one pass over the spans: the merged section replaces
+    # the first one, the rest are dropped, and the output is joined once
+    out = [content[:spans[0][0]], merged_content, "\n"]
+    prev_end = spans[0][1]
+    for start, end in spans[1:]:
+        out.append(content[prev_end:start])
+        prev_end = end
+    out.append(content[prev_end:])
     
     # Write the fixed content
-    with open(file_path, 'w') as f:
-        f.write(new_content)
+    Path(file_path).write_text(''.join(out))
     
     print(f"✓ Fixed duplicate sections in {file_path}")
-    print(f"✓ Merged {len(matches)} sections into one")
+    print(f"✓ Merged {len(spans)} sections into one")
     return True
 
 
@@ -4,43 +4,145 @@ Merge pyproject.toml files intelligently.
 Preserves existing [build-system] and [project] sections while adding tool configurations.
 """
 
+import itertools
+import mmap
 import sys
 import os
 from pathlib import Path
 
-try:
-    import tomli
-except ImportError:
-    print("Installing tomli for TOML parsing...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli"])
-    import tomli
 
+def _reference_parser():
+    """
+    Return the reference TOML parser: stdlib tomllib on 3.11+, otherwise tomli (installed if missing).
+    """
+    if sys.version_info >= (3, 11):
+        import tomllib
+        return tomllib
+    try:
+        import tomli
+    except ImportError:
+        print("Installing tomli for TOML parsing...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli"])
+        import tomli
+    return tomli
+
+
+# TOML parser: prefer rtoml when installed (compiled, and keeps table/key order so the
+# merged output is stable), otherwise the reference parser
 try:
-    import tomli_w
+    import rtoml
+    _loads = rtoml.loads
+    TOMLDecodeError = rtoml.TomlParsingError
 except ImportError:
-    print("Installing tomli_w for TOML writing...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli_w"])
-    import tomli_w
+    _parser = _reference_parser()
+    _loads = _parser.loads
+    TOMLDecodeError = _parser.TOMLDecodeError
+
+# TOML writer, imported on first use (see _get_writer)
+_tomli_w = None
 
 
-def _merge_dict_recursive(existing_dict, template_dict):
+# Tools we want to standardize from template (matched as name prefixes)
+_OVERWRITE_PREFIXES = ('black', 'isort', 'mypy', 'coverage', 'flake8', 'ruff')
+
+# Sentinel for "key not present" lookups
+_MISSING = object()
+
+# Files at least this large are memory-mapped rather than read through a buffer
+_MMAP_THRESHOLD = 1 << 20
+
+
+def _get_writer():
     """
-    Recursively merge dictionaries, preserving existing keys and only adding missing ones.
+    Import tomli_w on first use, installing it if missing.
     """
-    merged = existing_dict.copy()
-    
-    for key, value in template_dict.items():
-        if key not in merged:
+    global _tomli_w
+    if _tomli_w is None:
+        try:
+            import tomli_w
+        except ImportError:
+            print("Installing tomli_w for TOML writing...")
+            import subprocess
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "tomli_w"])
+            import tomli_w
+        _tomli_w = tomli_w
+    return _tomli_w
+
+
+def _read_bytes(file_path):
+    """
+    Read a whole file into memory with a single bulk read.
+    """
+    path = Path(file_path)
+    if path.stat().st_size < _MMAP_THRESHOLD:
+        return path.read_bytes()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return bytes(mm)
+
+
+def _load_toml(file_path):
+    """
+    Parse a TOML file, handing the whole document to the parser in one call.
+    Parse errors are re-raised with helpful messages for common issues.
+    """
+    text = _read_bytes(file_path).decode('utf-8')
+    try:
+        data = _loads(text)
+    except TOMLDecodeError as e:
+        _explain_decode_error(_reference_error(e, text), file_path)
+    return _intern_keys(data)
+
+
+def _reference_error(error, text):
+    """
+    Return the reference parser's error for a document that failed to parse.
+    Its messages (e.g. "Cannot declare ... twice") are the ones _explain_decode_error understands.
+    """
+    parser = _reference_parser()
+    if isinstance(error, parser.TOMLDecodeError):
+        return error
+    try:
+        parser.loads(text)
+    except parser.TOMLDecodeError as e:
+        return e
+    return error
+
+
+def _intern_keys(data):
+    """
+    Return a copy of a parsed TOML table with every key interned (recursing into sub-tables),
+    so keys shared between the existing and template files are the same string objects.
+    """
+    return {
+        sys.intern(key) if isinstance(key, str) else key: _intern_keys(value) if isinstance(value, dict) else value
+        for key, value in data.items()
+    }
+
+
+def _merge_into(existing, template):
+    """
+    Recursively merge template into existing in place, preserving existing keys and only adding missing ones.
+    """
+    for key, value in template.items():
+        current = existing.get(key, _MISSING)
+        if current is _MISSING:
             # Key doesn't exist, add it
-            merged[key] = value
-        elif isinstance(value, dict) and isinstance(merged[key], dict):
+            existing[key] = value
+        elif isinstance(value, dict) and isinstance(current, dict):
             # Both are dicts, merge recursively
-            merged[key] = _merge_dict_recursive(merged[key], value)
+            _merge_into(current, value)
         # If key exists and not both dicts, keep existing value (user's preference)
-    
-    return merged
+
+
+def _split_args(addopts_value):
+    """
+    Split an addopts string or list into individual arguments.
+    List items are split on their own, so items holding several arguments are normalized too.
+    """
+    if isinstance(addopts_value, str):
+        return addopts_value.split()
+    return [arg for item in addopts_value for arg in item.split()]
 
 
 def _extract_coverage_settings(addopts_value):
@@ -51,12 +153,7 @@ def _extract_coverage_settings(addopts_value):
     coverage_args = []
     other_args = []
     
-    # Convert to list if it's a string
-    if isinstance(addopts_value, str):
-        args = addopts_value.split()
-    else:
-        # If it's a list, join and split to normalize
-        args = ' '.join(addopts_value).split()
+    args = _split_args(addopts_value)
     
     i = 0
     while i < len(args):
@@ -111,18 +208,12 @@ def _merge_pytest_selectively(existing_pytest, template_pytest):
         user_coverage_args, user_other_args = _extract_coverage_settings(existing_addopts)
         
         # Start with template's standard args
-        if isinstance(template_addopts, str):
-            standard_args = template_addopts.split()
-        else:
-            standard_args = ' '.join(template_addopts).split()
-        
-        # Combine: template standards + user's coverage settings
-        all_args = standard_args + user_coverage_args
+        standard_args = _split_args(template_addopts)
         
-        # Remove duplicates while preserving order
+        # Combine template standards + user's coverage settings, removing duplicates while preserving order
         seen = set()
         unique_args = []
-        for arg in all_args:
+        for arg in itertools.chain(standard_args, user_coverage_args):
             if arg not in seen:
                 unique_args.append(arg)
                 seen.add(arg)
@@ -140,19 +231,13 @@ def _merge_pytest_selectively(existing_pytest, template_pytest):
     marker_names = set()
     merged_markers = []
     
-    # Add template markers first (standards)
-    for marker in template_markers:
-        marker_name = marker.split(':')[0].strip()
-        if marker_name not in marker_names:
-            merged_markers.append(marker)
-            marker_names.add(marker_name)
-    
-    # Add user's custom markers (preserve domain-specific ones)
-    for marker in existing_markers:
-        marker_name = marker.split(':')[0].strip()
-        if marker_name not in marker_names:
-            merged_markers.append(marker)
-            marker_names.add(marker_name)
+    # Add template markers first (standards), then user's custom markers (preserve domain-specific ones)
+    for markers in (template_markers, existing_markers):
+        for marker in markers:
+            marker_name = marker.split(':', 1)[0].strip()
+            if marker_name not in marker_names:
+                merged_markers.append(marker)
+                marker_names.add(marker_name)
     
     if merged_markers:
         merged_ini['markers'] = merged_markers
@@ -170,24 +255,19 @@ def _merge_pytest_selectively(existing_pytest, template_pytest):
     return {'ini_options': merged_ini}
 
 
-def _validate_toml_file(file_path):
+def _explain_decode_error(e, file_path):
     """
-    Validate TOML file and provide helpful error messages for common issues.
+    Raise a ValueError explaining a TOML decode error, with fix-up instructions for common issues.
     """
-    try:
-        with open(file_path, 'rb') as f:
-            tomli.load(f)
-        return True
-    except tomli.TOMLDecodeError as e:
-        error_msg = str(e)
-        if "Cannot declare" in error_msg and "twice" in error_msg:
-            # Extract section name from error message
-            import re
-            match = re.search(r"Cannot declare \('([^']+)'(?:, '([^']+)')?(?:, '([^']+)')?\) twice", error_msg)
-            if match:
-                sections = [s for s in match.groups() if s]
-                section_path = ".".join(sections)
-                raise ValueError(f"""
+    error_msg = str(e)
+    if "Cannot declare" in error_msg and "twice" in error_msg:
+        # Extract section name from error message
+        import re
+        match = re.search(r"Cannot declare \('([^']+)'(?:, '([^']+)')?(?:, '([^']+)')?\) twice", error_msg)
+        if match:
+            sections = [s for s in match.groups() if s]
+            section_path = ".".join(sections)
+            raise ValueError(f"""
 ❌ Duplicate TOML section detected in {file_path}
 
 The file contains multiple [{section_path}] sections, which is invalid TOML.
@@ -218,7 +298,7 @@ Example for [tool.pytest.ini_options] duplicates:
    addopts = "--cov"
    markers = ["slow"]
 """)
-        raise ValueError(f"Invalid TOML file {file_path}: {error_msg}")
+    raise ValueError(f"Invalid TOML file {file_path}: {error_msg}")
 
 
 def merge_pyproject_toml(existing_path, template_path, output_path=None, overwrite_tools=False):
@@ -234,20 +314,13 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
     if output_path is None:
         output_path = existing_path
     
-    # Validate input files first
-    if Path(existing_path).exists():
-        _validate_toml_file(existing_path)
-    _validate_toml_file(template_path)
-    
     # Read existing file
     existing_data = {}
     if Path(existing_path).exists():
-        with open(existing_path, 'rb') as f:
-            existing_data = tomli.load(f)
+        existing_data = _load_toml(existing_path)
     
     # Read template file
-    with open(template_path, 'rb') as f:
-        template_data = tomli.load(f)
+    template_data = _load_toml(template_path)
     
     # Merge strategy: Keep existing [build-system] and [project], merge/overwrite [tool] sections
     merged_data = {}
@@ -264,8 +337,6 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
         # Start with existing tools
         merged_data['tool'] = existing_data.get('tool', {})
         
-        # List of tools we want to standardize from template
-        tools_to_overwrite = ['black', 'isort', 'mypy', 'coverage', 'flake8', 'ruff']
         tools_to_merge_selectively = ['pytest']
         
         # Overwrite specified tools with template versions
@@ -278,7 +349,7 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
                             merged_data['tool'].get(tool_name, {}),
                             tool_config
                         )
-                elif any(tool_name.startswith(t) for t in tools_to_overwrite):
+                elif tool_name.startswith(_OVERWRITE_PREFIXES):
                     # Completely replace with template version
                     merged_data['tool'][tool_name] = tool_config
                 elif tool_name not in merged_data['tool']:
@@ -286,11 +357,20 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
                     merged_data['tool'][tool_name] = tool_config
     else:
         # Original merge behavior: preserve existing, add missing
-        merged_data['tool'] = existing_data.get('tool', {})
+        existing_tool = existing_data.get('tool')
+        template_tool = template_data.get('tool')
         
-        # Add template tool configurations without overwriting existing ones
-        if 'tool' in template_data:
-            for tool_name, tool_config in template_data['tool'].items():
+        if existing_tool is None:
+            # Nothing to preserve, take the template's tools as-is
+            merged_data['tool'] = template_tool or {}
+        elif template_tool is None:
+            # Nothing to add
+            merged_data['tool'] = existing_tool
+        else:
+            merged_data['tool'] = existing_tool
+            
+            # Add template tool configurations without overwriting existing ones
+            for tool_name, tool_config in template_tool.items():
                 if tool_name not in merged_data['tool']:
                     # Tool doesn't exist, add it completely
                     merged_data['tool'][tool_name] = tool_config
@@ -298,10 +378,7 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
                     # Tool exists, merge configurations intelligently
                     if isinstance(tool_config, dict) and isinstance(merged_data['tool'][tool_name], dict):
                         # For dict configs, recursively merge without overwriting existing keys
-                        merged_data['tool'][tool_name] = _merge_dict_recursive(
-                            merged_data['tool'][tool_name], 
-                            tool_config
-                        )
+                        _merge_into(merged_data['tool'][tool_name], tool_config)
                     # If not both dicts, keep existing (user's) configuration
     
     # Copy any other top-level sections from existing file (but not 'tool' since we handled that)
@@ -309,25 +386,20 @@ def merge_pyproject_toml(existing_path, template_path, output_path=None, overwri
         if key not in merged_data and key != 'tool':
             merged_data[key] = existing_data[key]
     
-    # Write merged configuration
-    with open(output_path, 'wb') as f:
-        tomli_w.dump(merged_data, f)
-    
-    # Post-process to fix multi-line string formatting
-    _fix_multiline_strings(output_path)
+    # Serialize, fix multi-line string formatting, then write merged configuration once
+    content = _fix_multiline_strings(_get_writer().dumps(merged_data))
+    Path(output_path).write_bytes(content.encode('utf-8'))
     
     return overwrite_tools
 
 
-def _fix_multiline_strings(file_path):
+def _fix_multiline_strings(content):
     """
     Fix multi-line string formatting that tomli_w escapes incorrectly.
     Specifically handles Black's extend-exclude pattern.
+    Returns the fixed TOML text.
     """
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Fix Black extend-exclude pattern - match the exact escaped format from file
+    # Fix Black extend-exclude pattern - match the exact escaped format tomli_w produces
     escaped_pattern = 'extend-exclude = "/(\\n  # directories\\n  \\\\.eggs\\n  | \\\\.git\\n  | \\\\.hg\\n  | \\\\.mypy_cache\\n  | \\\\.tox\\n  | \\\\.venv\\n  | build\\n  | dist\\n)/\\n"'
     
     fixed_pattern = """extend-exclude = '''
@@ -348,8 +420,7 @@ def _fix_multiline_strings(file_path):
         content = content.replace(escaped_pattern, fixed_pattern)
         print("  - Fixed Black extend-exclude formatting to use triple quotes")
     
-    with open(file_path, 'w') as f:
-        f.write(content)
+    return content
 
 
 def main():
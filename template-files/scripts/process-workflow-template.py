@@ -4,11 +4,38 @@ Simple template processor for GitHub Actions workflows.
 Removes Handlebars-style conditional blocks based on current phase and project structure.
 """
 
+import functools
+import os
 import sys
 import re
 import yaml
 from pathlib import Path
 
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    # PyYAML built without libyaml
+    from yaml import SafeLoader as _SafeLoader
+
+ALL_PHASES = ['PHASE_0', 'PHASE_1', 'PHASE_2', 'PHASE_3', 'PHASE_1_OR_HIGHER', 'PHASE_2_OR_HIGHER']
+ALL_CONDITIONS = ['HAS_FRONTEND', 'HAS_BACKEND'] + ALL_PHASES
+
+# Plain integer `current_phase: N` line, the only setting this script needs from the config
+_PHASE_RE = re.compile(rb'^[ \t]*current_phase[ \t]*:[ \t]*(\d+)[ \t\r]*(?:#.*)?$', re.MULTILINE)
+
+# Opening/closing marker for any known condition, e.g. {{#IF_PHASE_1}} or {{/IF_HAS_BACKEND}};
+# unknown conditionals never match and are left untouched
+_TOKEN_RE = re.compile(r'\{\{([#/])IF_(' + '|'.join(ALL_CONDITIONS) + r')\}\}\n?')
+
+def _read_current_phase(data):
+    """Extract quality_gates.current_phase, parsing the full YAML only when the simple scan is ambiguous"""
+    matches = _PHASE_RE.findall(data)
+    if len(matches) == 1:
+        return int(matches[0])
+    config = yaml.load(data, Loader=_SafeLoader)
+    return config.get('quality_gates', {}).get('current_phase', 0)
+
+@functools.lru_cache(maxsize=1)
 def read_quality_config():
     """Read the current phase and project settings from .quality-config.yaml"""
     config_file = Path('.quality-config.yaml')
@@ -16,13 +43,13 @@ def read_quality_config():
         return {'current_phase': 0, 'has_frontend': False, 'has_backend': True}
     
     try:
-        with open(config_file) as f:
-            config = yaml.safe_load(f)
-        current_phase = config.get('quality_gates', {}).get('current_phase', 0)
+        current_phase = _read_current_phase(config_file.read_bytes())
         
-        # Determine frontend/backend based on project structure
-        has_frontend = Path('frontend').exists() or Path('src').exists()
-        has_backend = Path('backend').exists() or Path('requirements.txt').exists() or Path('pyproject.toml').exists()
+        # Determine frontend/backend based on project structure (one directory listing instead of a stat per path)
+        with os.scandir('.') as entries:
+            names = {entry.name for entry in entries}
+        has_frontend = 'frontend' in names or 'src' in names
+        has_backend = 'backend' in names or 'requirements.txt' in names or 'pyproject.toml' in names
         
         return {
             'current_phase': current_phase,
@@ -32,32 +59,9 @@ def read_quality_config():
     except Exception:
         return {'current_phase': 0, 'has_frontend': False, 'has_backend': True}
 
-def process_template(template_content, config):
-    """Process template content by removing/keeping conditional blocks"""
+def _conditions_to_keep(config):
+    """Return the set of condition names whose blocks are kept for this config"""
     current_phase = config['current_phase']
-    has_frontend = config['has_frontend']
-    has_backend = config['has_backend']
-    
-    # Process frontend/backend conditionals
-    if has_frontend:
-        # Keep frontend blocks
-        template_content = re.sub(r'{{#IF_HAS_FRONTEND}}\n?', '', template_content)
-        template_content = re.sub(r'{{/IF_HAS_FRONTEND}}\n?', '', template_content)
-        template_content = re.sub(r'{{#IF_HAS_FRONTEND}}', '', template_content)
-        template_content = re.sub(r'{{/IF_HAS_FRONTEND}}', '', template_content)
-    else:
-        # Remove frontend blocks
-        template_content = re.sub(r'{{#IF_HAS_FRONTEND}}.*?{{/IF_HAS_FRONTEND}}\n?', '', template_content, flags=re.DOTALL)
-    
-    if has_backend:
-        # Keep backend blocks
-        template_content = re.sub(r'{{#IF_HAS_BACKEND}}\n?', '', template_content)
-        template_content = re.sub(r'{{/IF_HAS_BACKEND}}\n?', '', template_content)
-        template_content = re.sub(r'{{#IF_HAS_BACKEND}}', '', template_content)
-        template_content = re.sub(r'{{/IF_HAS_BACKEND}}', '', template_content)
-    else:
-        # Remove backend blocks
-        template_content = re.sub(r'{{#IF_HAS_BACKEND}}.*?{{/IF_HAS_BACKEND}}\n?', '', template_content, flags=re.DOTALL)
     
     # Process phase conditionals
     phases_to_keep = []
@@ -70,49 +74,73 @@ def process_template(template_content, config):
     elif current_phase >= 3:
         phases_to_keep = ['PHASE_3', 'PHASE_1_OR_HIGHER', 'PHASE_2_OR_HIGHER']
     
-    # Remove all phase blocks first
-    all_phases = ['PHASE_0', 'PHASE_1', 'PHASE_2', 'PHASE_3', 'PHASE_1_OR_HIGHER', 'PHASE_2_OR_HIGHER']
-    for phase in all_phases:
-        if phase in phases_to_keep:
-            # Keep these blocks by removing the conditional markers
-            template_content = re.sub(f'{{{{#IF_{phase}}}}}\\n?', '', template_content)
-            template_content = re.sub(f'{{{{/IF_{phase}}}}}\\n?', '', template_content)
-            template_content = re.sub(f'{{{{#IF_{phase}}}}}', '', template_content)
-            template_content = re.sub(f'{{{{/IF_{phase}}}}}', '', template_content)
-        else:
-            # Remove these blocks entirely
-            template_content = re.sub(f'{{{{#IF_{phase}}}}}.*?{{{{/IF_{phase}}}}}\\n?', '', template_content, flags=re.DOTALL)
+    conditions_to_keep = set(phases_to_keep)
+    if config['has_frontend']:
+        conditions_to_keep.add('HAS_FRONTEND')
+    if config['has_backend']:
+        conditions_to_keep.add('HAS_BACKEND')
+    return conditions_to_keep
+
+def _iter_processed(template_content, config):
+    """Yield the kept chunks of the template, removing conditional blocks and markers"""
+    conditions_to_keep = _conditions_to_keep(config)
     
-    return template_content
+    # Single left-to-right scan: yield text only while every enclosing block is kept
+    stack = []
+    emitting = True
+    pos = 0
+    for match in _TOKEN_RE.finditer(template_content):
+        kind, name = match.groups()
+        if kind == '/' and not (stack and stack[-1][0] == name):
+            # Stray or mismatched close marker: leave it in the output so the mistake is visible
+            continue
+        if emitting and match.start() > pos:
+            yield template_content[pos:match.start()]
+        pos = match.end()
+        if kind == '#':
+            stack.append((name, emitting, match.start()))
+            emitting = emitting and name in conditions_to_keep
+        else:
+            _, emitting, _ = stack.pop()
+    if emitting:
+        yield template_content[pos:]
+    else:
+        # A dropped block was never closed: keep everything from its opening marker
+        # onward instead of silently removing the rest of the template
+        yield template_content[next(start for _, was_emitting, start in reversed(stack) if was_emitting):]
+
+def process_template(template_content, config):
+    """Process template content by removing/keeping conditional blocks"""
+    return ''.join(_iter_processed(template_content, config))
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: process-workflow-template.py <input_template> <output_file>")
+    if len(sys.argv) < 3 or len(sys.argv) % 2 == 0:
+        print("Usage: process-workflow-template.py <input_template> <output_file> [<input_template> <output_file> ...]")
         sys.exit(1)
     
-    input_file = Path(sys.argv[1])
-    output_file = Path(sys.argv[2])
+    pairs = [(Path(sys.argv[i]), Path(sys.argv[i + 1])) for i in range(1, len(sys.argv), 2)]
     
-    if not input_file.exists():
-        print(f"Error: Template file {input_file} not found")
-        sys.exit(1)
+    for input_file, _ in pairs:
+        if not input_file.exists():
+            print(f"Error: Template file {input_file} not found")
+            sys.exit(1)
     
-    # Read configuration
+    # Read configuration once for every template
     config = read_quality_config()
     
-    # Read and process template
-    with open(input_file) as f:
-        template_content = f.read()
-    
-    processed_content = process_template(template_content, config)
-    
-    # Write output
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_file, 'w') as f:
-        f.write(processed_content)
+    for input_file, output_file in pairs:
+        # Read and process template
+        with open(input_file) as f:
+            template_content = f.read()
+        
+        # Stream processed chunks straight to the output file
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file, 'w', buffering=1 << 20) as f:
+            f.writelines(_iter_processed(template_content, config))
+        
+        print(f"Processed template: {input_file} -> {output_file}")
     
-    print(f"Processed template: {input_file} -> {output_file}")
     print(f"Phase: {config['current_phase']}, Frontend: {config['has_frontend']}, Backend: {config['has_backend']}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()